@@ -0,0 +1,126 @@
+# admission.py
+import asyncio
+import functools
+import logging
+
+logger = logging.getLogger(__name__)
+
+BUSY_MESSAGE = "Сервер сейчас перегружен. Попробуйте, пожалуйста, чуть позже."
+
+
+class AdmissionController:
+    """
+    Ограничивает количество одновременно обрабатываемых апдейтов и длину очереди ожидания.
+
+    Лимит параллельности подстраивается под наблюдаемую задержку DBManager:
+    если БД отвечает медленнее target_latency_ms, лимит уменьшается, если быстрее - плавно растет.
+    При перегрузке низкоприоритетные команды сразу получают ответ "занято",
+    а при переполненной очереди так же отвечают и все остальные.
+
+    Обработчики обращаются к БД через AsyncStorage (пул потоков и пул соединений DBManager) и делают
+    запросы последовательно, поэтому лимит параллельности одновременно ограничивает и число запросов к БД.
+    Event loop при этом не блокируется: решение "занято" принимается сразу, даже если БД зависла.
+    Чтобы переполнение доходило до контроллера без задержки, лимит concurrent_updates в PTB
+    должен быть заметно больше max_concurrency + max_queue (см. PTB_CONCURRENT_UPDATES в main.py).
+    """
+
+    def __init__(self, db_manager, max_concurrency=16, min_concurrency=2, max_queue=100,
+                 target_latency_ms=100, overload_latency_ms=500, queue_timeout_seconds=10):
+        self.db_manager = db_manager
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_queue = max_queue
+        self.target_latency_ms = target_latency_ms
+        self.overload_latency_ms = overload_latency_ms
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        self._limit = max_concurrency
+        self._in_flight = 0
+        self._waiting = 0
+        self._condition = None # Создается лениво внутри работающего event loop
+        self.shed_count = 0
+
+    def _get_condition(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def _adjust_limit(self):
+        latency = self.db_manager.get_latency_ms()
+        if latency is None:
+            return
+        if latency > self.target_latency_ms:
+            # Мультипликативное уменьшение при медленной БД
+            new_limit = max(self.min_concurrency, int(self._limit * 0.7))
+        else:
+            # Аддитивное увеличение, когда БД снова отвечает быстро
+            new_limit = min(self.max_concurrency, self._limit + 1)
+        if new_limit != self._limit:
+            logger.info(f"Admission limit changed {self._limit} -> {new_limit} (DB latency {latency:.1f} ms).")
+            self._limit = new_limit
+
+    def is_overloaded(self):
+        latency = self.db_manager.get_latency_ms()
+        if latency is not None and latency > self.overload_latency_ms:
+            return True
+        return self._waiting >= self.max_queue // 2
+
+    async def _acquire(self):
+        # Свободный слот занимаем сразу, без await: в однопоточном event loop проверка и захват атомарны.
+        # Если кто-то уже ждет, встаем в очередь за ним, чтобы не обгонять.
+        if self._in_flight < self._limit and self._waiting == 0:
+            self._in_flight += 1
+            return
+
+        condition = self._get_condition()
+        self._waiting += 1 # В очереди считаются только те, кому действительно пришлось ждать
+        try:
+            async with condition:
+                await asyncio.wait_for(
+                    condition.wait_for(lambda: self._in_flight < self._limit),
+                    timeout=self.queue_timeout_seconds
+                )
+                self._in_flight += 1
+        finally:
+            self._waiting -= 1
+
+    async def _release(self):
+        condition = self._get_condition()
+        async with condition:
+            self._in_flight -= 1
+            self._adjust_limit()
+            condition.notify_all()
+
+    async def _reply_busy(self, update):
+        self.shed_count += 1
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(BUSY_MESSAGE)
+            elif update.effective_message:
+                await update.effective_message.reply_text(BUSY_MESSAGE)
+        except Exception as e:
+            logger.warning(f"Failed to send busy reply: {e}")
+
+    def wrap(self, handler, low_priority=False):
+        # Оборачивает обработчик python-telegram-bot, пропуская его через контроль нагрузки
+        @functools.wraps(handler)
+        async def wrapped(update, context):
+            if low_priority and self.is_overloaded():
+                logger.info(f"Shedding low-priority handler {handler.__name__} under overload.")
+                await self._reply_busy(update)
+                return
+            if self._waiting >= self.max_queue:
+                logger.warning(f"Admission queue is full ({self._waiting}), shedding {handler.__name__}.")
+                await self._reply_busy(update)
+                return
+            try:
+                await self._acquire()
+            except asyncio.TimeoutError:
+                logger.warning(f"Timed out waiting for admission, shedding {handler.__name__}.")
+                await self._reply_busy(update)
+                return
+            try:
+                return await handler(update, context)
+            finally:
+                await self._release()
+        return wrapped
@@ -0,0 +1,82 @@
+# circuit_breaker.py
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed" # Все запросы идут в БД
+STATE_OPEN = "open" # БД считается недоступной, запросы сразу отклоняются
+STATE_HALF_OPEN = "half_open" # Идет фоновая проверка восстановления
+
+
+class CircuitOpenError(Exception):
+    """Запрос отклонен без обращения к БД, потому что предохранитель разомкнут."""
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для слоя БД.
+
+    После failure_threshold ошибок подряд размыкается и отклоняет запросы мгновенно,
+    вместо того чтобы каждый апдейт ждал таймаута подключения.
+    Пока предохранитель разомкнут, фоновый поток раз в probe_interval_seconds вызывает probe();
+    первая успешная проверка снова замыкает его.
+    """
+
+    def __init__(self, probe, failure_threshold=3, probe_interval_seconds=5):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.probe_interval_seconds = probe_interval_seconds
+
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+        self._probe_thread = None
+
+    @property
+    def state(self):
+        return self._state
+
+    def is_closed(self):
+        return self._state == STATE_CLOSED
+
+    def before_call(self):
+        if self._state != STATE_CLOSED:
+            raise CircuitOpenError("Database circuit breaker is open.")
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+            if self._state != STATE_CLOSED:
+                logger.info(f"Database circuit breaker closed after {time.monotonic() - self._opened_at:.1f}s.")
+                self._state = STATE_CLOSED
+                self._opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == STATE_CLOSED and self._consecutive_failures >= self.failure_threshold:
+                logger.error(f"Database circuit breaker opened after {self._consecutive_failures} consecutive failures.")
+                self._state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._start_probe_thread()
+
+    def _start_probe_thread(self):
+        if self._probe_thread is not None and self._probe_thread.is_alive():
+            return
+        self._probe_thread = threading.Thread(target=self._probe_loop, name="db-circuit-probe", daemon=True)
+        self._probe_thread.start()
+
+    def _probe_loop(self):
+        while self._state != STATE_CLOSED:
+            time.sleep(self.probe_interval_seconds)
+            self._state = STATE_HALF_OPEN
+            try:
+                self.probe()
+            except Exception as e:
+                logger.warning(f"Database recovery probe failed: {e}")
+                self._state = STATE_OPEN
+            else:
+                self.record_success()
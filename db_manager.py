@@ -1,15 +1,116 @@
 import os
+import time
+import threading
 import psycopg2
+import psycopg2.pool
 from psycopg2 import sql
 import logging
+from collections import OrderedDict
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from storage import StorageBackend
 
 # Настройка логирования для отладки
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class DBManager:
+# Коэффициент сглаживания для скользящей средней задержки запросов
+LATENCY_EWMA_ALPHA = 0.2
+
+# Настройки предохранителя и деградированного режима
+DB_CONNECT_TIMEOUT_SECONDS = int(os.getenv('DB_CONNECT_TIMEOUT', 5))
+# Зависший запрос или сервер надолго занимает поток и соединение из пула,
+# поэтому ограничиваем время выполнения запроса и включаем TCP keepalive для обнаружения мертвых соединений
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 5000))
+DB_KEEPALIVES_IDLE_SECONDS = int(os.getenv('DB_KEEPALIVES_IDLE', 30))
+DB_KEEPALIVES_INTERVAL_SECONDS = int(os.getenv('DB_KEEPALIVES_INTERVAL', 10))
+DB_KEEPALIVES_COUNT = int(os.getenv('DB_KEEPALIVES_COUNT', 3))
+# Размер пула соединений; AsyncStorage выполняет запросы не более чем в стольких потоках
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 20))
+DB_FAILURE_THRESHOLD = int(os.getenv('DB_FAILURE_THRESHOLD', 3))
+DB_PROBE_INTERVAL_SECONDS = float(os.getenv('DB_PROBE_INTERVAL', 5))
+LAST_KNOWN_GOOD_CACHE_SIZE = 10000
+
+# Ошибки, означающие недоступность БД (а не ошибку в конкретном запросе)
+OUTAGE_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, CircuitOpenError)
+
+class _LastKnownGoodCache:
+    """Ограниченный LRU-кэш последних успешно прочитанных записей для деградированного режима."""
+
+    def __init__(self, max_size=LAST_KNOWN_GOOD_CACHE_SIZE):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock() # Запросы выполняются из нескольких потоков AsyncStorage
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+class _TimedCursor:
+    """
+    Курсор на соединении из пула: замеряет время от получения соединения до выхода из блока with
+    и возвращает соединение в пул. Соединение после сетевой ошибки закрывается, а не переиспользуется.
+    """
+
+    def __init__(self, db_manager, pool, connection, started_at):
+        self._db_manager = db_manager
+        self._pool = pool
+        self._connection = connection
+        self._started_at = started_at
+        self._cursor = None
+
+    def __enter__(self):
+        try:
+            self._cursor = self._connection.cursor()
+        except Exception as e:
+            self._finish(type(e))
+            raise
+        return self._cursor
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self._cursor.close()
+        except Exception:
+            pass # Соединение уже могло быть разорвано
+        finally:
+            self._finish(exc_type)
+
+    def _finish(self, exc_type):
+        self._db_manager._record_latency(time.monotonic() - self._started_at)
+        outage = exc_type is not None and issubclass(exc_type, OUTAGE_ERRORS)
+        try:
+            self._pool.putconn(self._connection, close=outage or bool(self._connection.closed))
+        except psycopg2.pool.PoolError:
+            self._connection.close() # Пул уже закрыт фоновой проверкой предохранителя
+        if outage:
+            DBManager._circuit_breaker.record_failure()
+        else:
+            DBManager._circuit_breaker.record_success()
+
+class DBManager(StorageBackend):
     _instance = None
-    _connection = None
+    _pool = None # ThreadedConnectionPool, пересоздается после сбоя
+    _pool_lock = threading.Lock()
+    _latency_ewma_ms = None # Сглаженная задержка запросов к БД (мс), None - замеров еще не было
+    _circuit_breaker = None
+    _user_cache = None # telegram_id -> последняя успешно прочитанная запись users
+    _pet_cache = None # owner_id -> последняя успешно прочитанная запись pets
+
+    max_connections = DB_POOL_SIZE
 
     def __new__(cls):
         if cls._instance is None:
@@ -17,34 +118,101 @@ class DBManager:
         return cls._instance
 
     def __init__(self):
-        if DBManager._connection is None:
-            self._connect()
+        if DBManager._circuit_breaker is None:
+            DBManager._circuit_breaker = CircuitBreaker(
+                self._probe_connection,
+                failure_threshold=DB_FAILURE_THRESHOLD,
+                probe_interval_seconds=DB_PROBE_INTERVAL_SECONDS
+            )
+            DBManager._user_cache = _LastKnownGoodCache()
+            DBManager._pet_cache = _LastKnownGoodCache()
+        with DBManager._pool_lock:
+            if DBManager._pool is None:
+                self._connect()
 
-    def _connect(self):
+    def _connect(self, quiet=False):
+        # Вызывается под _pool_lock. quiet=True - для фоновой проверки предохранителя:
+        # о неудачной проверке одной строкой сообщает сам CircuitBreaker, без трассировки на каждую попытку
         try:
             database_url = os.getenv('DATABASE_URL')
             if not database_url:
-                logger.error("DATABASE_URL environment variable not set.")
+                if not quiet:
+                    logger.error("DATABASE_URL environment variable not set.")
                 raise ValueError("DATABASE_URL environment variable not set.")
             
-            DBManager._connection = psycopg2.connect(database_url)
-            DBManager._connection.autocommit = True # Автоматическая фиксация изменений
-            logger.info("Successfully connected to PostgreSQL database.")
-            self._create_tables()
+            DBManager._pool = psycopg2.pool.ThreadedConnectionPool(
+                1,
+                DB_POOL_SIZE,
+                database_url,
+                connect_timeout=DB_CONNECT_TIMEOUT_SECONDS,
+                options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+                keepalives=1,
+                keepalives_idle=DB_KEEPALIVES_IDLE_SECONDS,
+                keepalives_interval=DB_KEEPALIVES_INTERVAL_SECONDS,
+                keepalives_count=DB_KEEPALIVES_COUNT
+            )
+            logger.info(f"Successfully connected to PostgreSQL database (pool size {DB_POOL_SIZE}).")
+            self._create_tables(quiet=quiet)
         except Exception as e:
-            logger.exception(f"Error connecting to PostgreSQL database: {e}")
-            DBManager._connection = None # Сбросить соединение, чтобы при следующей попытке оно было None
+            if not quiet:
+                logger.exception(f"Error connecting to PostgreSQL database: {e}")
+            self._close_pool() # Сбросить пул, чтобы при следующей попытке он создавался заново
             raise # Повторно выбросить исключение, чтобы остановить инициализацию, если БД недоступна
 
+    def _close_pool(self):
+        if DBManager._pool is not None and not DBManager._pool.closed:
+            DBManager._pool.closeall()
+        DBManager._pool = None
+
     def _get_cursor(self):
-        if DBManager._connection is None or DBManager._connection.closed:
-            logger.debug("Re-establishing PostgreSQL connection.")
-            self._connect() # Попытка переподключения
-        return DBManager._connection.cursor()
+        # При разомкнутом предохранителе сразу бросаем CircuitOpenError, не дожидаясь таймаута подключения
+        DBManager._circuit_breaker.before_call()
+        started_at = time.monotonic()
+        try:
+            with DBManager._pool_lock:
+                if DBManager._pool is None:
+                    logger.debug("Re-creating PostgreSQL connection pool.")
+                    self._connect() # Попытка переподключения
+                pool = DBManager._pool
+            connection = pool.getconn()
+        except Exception:
+            DBManager._circuit_breaker.record_failure()
+            raise
+        connection.autocommit = True # Автоматическая фиксация изменений
+        return _TimedCursor(self, pool, connection, started_at)
+
+    def _probe_connection(self):
+        # Вызывается фоновым потоком предохранителя: пересоздаем пул и проверяем БД простым запросом
+        with DBManager._pool_lock:
+            self._close_pool()
+            self._connect(quiet=True)
+            connection = DBManager._pool.getconn()
+            try:
+                with connection.cursor() as cur:
+                    cur.execute("SELECT 1;")
+            finally:
+                DBManager._pool.putconn(connection)
+
+    def is_available(self):
+        # False, пока предохранитель разомкнут и БД считается недоступной
+        return DBManager._circuit_breaker.is_closed()
+
+    def _record_latency(self, elapsed_seconds):
+        elapsed_ms = elapsed_seconds * 1000
+        if DBManager._latency_ewma_ms is None:
+            DBManager._latency_ewma_ms = elapsed_ms
+        else:
+            DBManager._latency_ewma_ms += LATENCY_EWMA_ALPHA * (elapsed_ms - DBManager._latency_ewma_ms)
+
+    def get_latency_ms(self):
+        # Сглаженная задержка запросов к БД в миллисекундах (None, если запросов еще не было)
+        return DBManager._latency_ewma_ms
 
-    def _create_tables(self):
+    def _create_tables(self, quiet=False):
+        connection = DBManager._pool.getconn() # Напрямую, в обход предохранителя: вызывается из _connect
         try:
-            with self._get_cursor() as cur:
+            connection.autocommit = True
+            with connection.cursor() as cur:
                 # Создаем таблицу users
                 cur.execute("""
                     CREATE TABLE IF NOT EXISTS users (
@@ -86,6 +254,15 @@ class DBManager:
                     );
                 """)
                 logger.debug("Table 'game_stats' ensured to exist.")
+
+                # Создаем таблицу processed_updates (идемпотентность вебхуков между процессами)
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS processed_updates (
+                        update_id BIGINT PRIMARY KEY,
+                        processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    );
+                """)
+                logger.debug("Table 'processed_updates' ensured to exist.")
                 
                 # Инициализация game_stats, если она пуста
                 cur.execute("SELECT COUNT(*) FROM game_stats;")
@@ -94,14 +271,17 @@ class DBManager:
                     logger.debug("game_stats initialized.")
 
         except Exception as e:
-            logger.exception(f"Error creating tables: {e}")
+            if not quiet:
+                logger.exception(f"Error creating tables: {e}")
             raise # Перевыбросить исключение
+        finally:
+            DBManager._pool.putconn(connection)
 
     def close(self):
-        if DBManager._connection:
-            DBManager._connection.close()
-            DBManager._connection = None
-            logger.info("Database connection closed.")
+        with DBManager._pool_lock:
+            if DBManager._pool is not None:
+                self._close_pool()
+                logger.info("Database connection pool closed.")
 
     def get_user(self, telegram_id):
         logger.debug(f"get_user called for telegram_id: {telegram_id}")
@@ -115,13 +295,50 @@ class DBManager:
                     user_data_list = list(user_data)
                     if user_data_list[6]: # last_daily_bonus
                         user_data_list[6] = user_data_list[6].replace(tzinfo=None) # Удаляем информацию о таймзоне
-                    return tuple(user_data_list)
+                    user_data = tuple(user_data_list)
+                    DBManager._user_cache.put(telegram_id, user_data)
+                    DBManager._user_cache.put(("id", user_data[0]), user_data)
+                    return user_data
                 logger.debug(f"User not found for telegram_id: {telegram_id}")
+                DBManager._user_cache.discard(telegram_id)
                 return None
+        except OUTAGE_ERRORS as e:
+            cached_user = DBManager._user_cache.get(telegram_id)
+            if cached_user is not None:
+                logger.warning(f"Database unavailable ({e}), serving cached user {telegram_id}.")
+                return cached_user
+            logger.warning(f"Database unavailable ({e}), no cached user {telegram_id}.")
+            return None
         except Exception as e:
             logger.exception(f"Error getting user {telegram_id}: {e}")
             return None
 
+    def get_user_by_id(self, user_id):
+        logger.debug(f"get_user_by_id called for user_id: {user_id}")
+        try:
+            with self._get_cursor() as cur:
+                cur.execute("SELECT id, telegram_id, username, first_name, last_name, balance, last_daily_bonus FROM users WHERE id = %s;", (user_id,))
+                user_data = cur.fetchone()
+                if user_data:
+                    user_data_list = list(user_data)
+                    if user_data_list[6]: # last_daily_bonus
+                        user_data_list[6] = user_data_list[6].replace(tzinfo=None) # Удаляем информацию о таймзоне
+                    user_data = tuple(user_data_list)
+                    DBManager._user_cache.put(("id", user_id), user_data)
+                    return user_data
+                logger.debug(f"User not found for user_id: {user_id}")
+                return None
+        except OUTAGE_ERRORS as e:
+            cached_user = DBManager._user_cache.get(("id", user_id))
+            if cached_user is not None:
+                logger.warning(f"Database unavailable ({e}), serving cached user id {user_id}.")
+                return cached_user
+            logger.warning(f"Database unavailable ({e}), no cached user id {user_id}.")
+            return None
+        except Exception as e:
+            logger.exception(f"Error getting user by id {user_id}: {e}")
+            return None
+
     def add_user(self, telegram_id, username, first_name, last_name):
         logger.debug(f"add_user called for telegram_id: {telegram_id}")
         try:
@@ -138,6 +355,9 @@ class DBManager:
         except psycopg2.errors.UniqueViolation:
             logger.warning(f"User {telegram_id} already exists (add_user called but user exists).")
             return self.get_user(telegram_id)[0] # Возвращаем ID существующего пользователя
+        except CircuitOpenError:
+            logger.debug("add_user skipped: database circuit breaker is open.")
+            return None
         except Exception as e:
             logger.exception(f"Error adding user {telegram_id}: {e}")
             return None
@@ -153,6 +373,9 @@ class DBManager:
                 if amount > 0:
                     cur.execute("UPDATE game_stats SET total_emitted_tamacoin = total_emitted_tamacoin + %s;", (amount,))
                 return new_balance
+        except CircuitOpenError:
+            logger.debug("update_user_balance skipped: database circuit breaker is open.")
+            return None
         except Exception as e:
             logger.exception(f"Error updating user {user_id} balance: {e}")
             return None
@@ -165,6 +388,9 @@ class DBManager:
                 cur.execute("UPDATE users SET last_daily_bonus = %s WHERE id = %s;", (datetime.now(), user_id))
                 logger.info(f"User {user_id} last_daily_bonus updated.")
             return True
+        except CircuitOpenError:
+            logger.debug("update_user_daily_bonus_time skipped: database circuit breaker is open.")
+            return False
         except Exception as e:
             logger.exception(f"Error updating last_daily_bonus for user {user_id}: {e}")
             return False
@@ -182,6 +408,9 @@ class DBManager:
         except psycopg2.errors.UniqueViolation:
             logger.warning(f"Pet already exists for owner_id {owner_id}. Skipping creation.")
             return False # Или True, если вы считаете, что это не ошибка
+        except CircuitOpenError:
+            logger.debug("create_pet skipped: database circuit breaker is open.")
+            return False
         except Exception as e:
             logger.exception(f"Error creating pet for owner_id {owner_id}: {e}")
             return False
@@ -202,9 +431,19 @@ class DBManager:
                     for i in [7, 8, 9, 10]: # Индексы для last_fed, last_played, last_cleaned, last_interacted
                         if pet_data_list[i]:
                             pet_data_list[i] = pet_data_list[i].replace(tzinfo=None) # Удаляем информацию о таймзоне
-                    return tuple(pet_data_list)
+                    pet_data = tuple(pet_data_list)
+                    DBManager._pet_cache.put(owner_id, pet_data)
+                    return pet_data
                 logger.debug(f"Pet not found for owner_id {owner_id}.")
+                DBManager._pet_cache.discard(owner_id)
                 return None
+        except OUTAGE_ERRORS as e:
+            cached_pet = DBManager._pet_cache.get(owner_id)
+            if cached_pet is not None:
+                logger.warning(f"Database unavailable ({e}), serving cached pet for owner_id {owner_id}.")
+                return cached_pet
+            logger.warning(f"Database unavailable ({e}), no cached pet for owner_id {owner_id}.")
+            return None
         except Exception as e:
             logger.exception(f"Error getting pet for owner_id {owner_id}: {e}")
             return None
@@ -251,6 +490,9 @@ class DBManager:
                 cur.execute(query, tuple(params))
                 logger.info(f"Pet {pet_id} stats updated.")
             return True
+        except CircuitOpenError:
+            logger.debug("update_pet_stats skipped: database circuit breaker is open.")
+            return False
         except Exception as e:
             logger.exception(f"Error updating pet {pet_id} stats: {e}")
             return False
@@ -266,6 +508,9 @@ class DBManager:
                     return {"total_emitted_tamacoin": stats[0], "total_users": stats[1]}
                 logger.warning("Game stats not found or table empty.")
                 return {"total_emitted_tamacoin": 0, "total_users": 0}
+        except CircuitOpenError:
+            logger.debug("get_game_stats skipped: database circuit breaker is open.")
+            return {"total_emitted_tamacoin": 0, "total_users": 0}
         except Exception as e:
             logger.exception(f"Error getting game stats: {e}")
             return {"total_emitted_tamacoin": 0, "total_users": 0}
@@ -278,6 +523,43 @@ class DBManager:
                 count = cur.fetchone()[0]
                 logger.debug(f"Total users count: {count}")
                 return count
+        except CircuitOpenError:
+            logger.debug("get_total_users_count skipped: database circuit breaker is open.")
+            return 0
         except Exception as e:
             logger.exception(f"Error getting total users count: {e}")
             return 0
+
+    def mark_update_processed(self, update_id):
+        # Возвращает True, если update_id записан впервые, False - если он уже обрабатывался
+        logger.debug(f"mark_update_processed called for update_id: {update_id}")
+        try:
+            with self._get_cursor() as cur:
+                cur.execute(
+                    "INSERT INTO processed_updates (update_id) VALUES (%s) ON CONFLICT (update_id) DO NOTHING RETURNING update_id;",
+                    (update_id,)
+                )
+                return cur.fetchone() is not None
+        except CircuitOpenError:
+            logger.debug("mark_update_processed skipped: database circuit breaker is open.")
+            return None
+        except Exception as e:
+            logger.exception(f"Error marking update {update_id} as processed: {e}")
+            return None
+
+    def prune_processed_updates(self, max_age_hours=24):
+        logger.debug(f"prune_processed_updates called, max_age_hours: {max_age_hours}")
+        try:
+            with self._get_cursor() as cur:
+                cur.execute(
+                    "DELETE FROM processed_updates WHERE processed_at < NOW() - %s * INTERVAL '1 hour';",
+                    (max_age_hours,)
+                )
+                logger.info(f"Pruned {cur.rowcount} old processed updates.")
+            return True
+        except CircuitOpenError:
+            logger.debug("prune_processed_updates skipped: database circuit breaker is open.")
+            return False
+        except Exception as e:
+            logger.exception(f"Error pruning processed updates: {e}")
+            return False
@@ -0,0 +1,255 @@
+# economy_sim.py
+"""
+Офлайн-симулятор экономики для подбора констант pet_config.
+
+Популяция питомцев хранится в массивах NumPy (по элементу на питомца), и каждый шаг
+длиной DEGRADATION_INTERVAL_SECONDS применяется ко всей популяции сразу:
+сначала ухудшение состояния (*_DEGRADATION_PER_INTERVAL), затем случайные действия
+игроков по тем же правилам, что и в PetGame (feed_pet / play_with_pet / clean_pet_area).
+Питомец умирает, когда здоровье падает до 0.
+
+NumPy нужен только для симулятора, боту он не требуется: pip install numpy
+
+Пример:
+    python economy_sim.py --pets 1000000 --weeks 4
+"""
+import argparse
+import time
+
+import numpy as np
+
+import pet_config
+
+STAT_MAX = 100 # Все параметры питомца лежат в диапазоне 0..100, как в PetGame
+SECONDS_PER_HOUR = 3600
+SECONDS_PER_DAY = 24 * SECONDS_PER_HOUR
+NIGHT_END_HOUR = 8 # С 0 до 8 часов игроки заходят реже (night_factor)
+
+
+class EconomySimulator:
+    """
+    Векторизованная модель популяции питомцев.
+
+    Поведение игроков стохастическое: у каждого игрока своя вовлеченность (Beta-распределение
+    со средним mean_engagement) - вероятность зайти в игру за час; ночью она умножается на night_factor.
+    Для шага длиной DEGRADATION_INTERVAL_SECONDS она пересчитывается в вероятность зайти хотя бы раз
+    за шаг. Зашедший игрок независимо кормит, играет и убирает с вероятностями p_feed, p_play, p_clean.
+    Время суток и границы суток считаются по step_count * DEGRADATION_INTERVAL_SECONDS.
+    Раз в сутки игрок может навсегда бросить игру (churn_per_day) и, пока играет,
+    забирает ежедневный бонус с вероятностью p_daily_bonus.
+
+    total_emitted считается как game_stats.total_emitted_tamacoin - только реальные начисления.
+    Бот пока не выдает стартовые монеты (add_user оставляет баланс 0), поэтому initial_grant -
+    гипотетический параметр для проверки идеи "выдавать INITIAL_TA_COIN новым игрокам";
+    он отчитывается отдельно (initial_grant_total) и в эмиссию не входит.
+    """
+
+    def __init__(self, num_pets, seed=None, mean_engagement=0.15, engagement_concentration=2.0,
+                 night_factor=0.3, p_feed=0.6, p_play=0.5, p_clean=0.3, churn_per_day=0.02,
+                 daily_bonus=0, p_daily_bonus=0.5, initial_grant=0):
+        self.num_pets = num_pets
+        self.rng = np.random.default_rng(seed)
+        self.night_factor = night_factor
+        self.p_feed = p_feed
+        self.p_play = p_play
+        self.p_clean = p_clean
+        self.churn_per_day = churn_per_day
+        self.daily_bonus = daily_bonus
+        self.p_daily_bonus = p_daily_bonus
+        self.initial_grant = initial_grant
+
+        # int16 хватает для 0..100 и экономит память на миллионах питомцев.
+        # Массивы содержат только живых питомцев: умершие вычищаются раз в сутки (_compact)
+        self.health = np.full(num_pets, pet_config.INITIAL_HEALTH, dtype=np.int16)
+        self.happiness = np.full(num_pets, pet_config.INITIAL_HAPPINESS, dtype=np.int16)
+        self.hunger = np.full(num_pets, pet_config.INITIAL_HUNGER, dtype=np.int16)
+        self.alive = np.ones(num_pets, dtype=bool) # Умер ли питомец с момента последней чистки
+        self.playing = np.ones(num_pets, dtype=bool) # Игрок еще не бросил игру
+
+        self.step_seconds = pet_config.DEGRADATION_INTERVAL_SECONDS
+        step_hours = self.step_seconds / SECONDS_PER_HOUR
+        alpha = mean_engagement * engagement_concentration
+        beta = (1 - mean_engagement) * engagement_concentration
+        hourly_engagement = self.rng.beta(alpha, beta, num_pets)
+        # Вероятность зайти хотя бы раз за шаг: 1 - (1 - p_час) ** (часов в шаге)
+        self.engagement = (1 - (1 - hourly_engagement) ** step_hours).astype(np.float32)
+        self.night_engagement = (1 - (1 - hourly_engagement * night_factor) ** step_hours).astype(np.float32)
+
+        self.total_emitted = 0 # Как game_stats.total_emitted_tamacoin
+        self.initial_grant_total = num_pets * initial_grant # Гипотетическое стартовое начисление, вне эмиссии
+        self.deaths_total = 0
+        self.step_count = 0
+        self._day = -1 # Номер суток, для которых уже выполнен _daily
+        self.action_counts = {"feed": 0, "play": 0, "clean": 0}
+
+    def _degrade(self):
+        # Ухудшаем всех подряд: у умерших за сутки питомцев параметры уже не важны
+        self.hunger += pet_config.HUNGER_DEGRADATION_PER_INTERVAL
+        self.health -= pet_config.HEALTH_DEGRADATION_PER_INTERVAL
+        self.happiness -= pet_config.HAPPINESS_DEGRADATION_PER_INTERVAL
+        np.minimum(self.hunger, STAT_MAX, out=self.hunger)
+        np.maximum(self.health, 0, out=self.health)
+        np.maximum(self.happiness, 0, out=self.happiness)
+
+    def _act(self, hour_of_day):
+        engagement = self.night_engagement if hour_of_day < NIGHT_END_HOUR else self.engagement
+        roll = self.rng.random(len(engagement), dtype=np.float32)
+        active = np.flatnonzero((roll < engagement) & self.alive & self.playing)
+        # Дальше работаем только с небольшим подмножеством активных игроков
+        health = self.health[active]
+        happiness = self.happiness[active]
+        hunger = self.hunger[active]
+        rolls = self.rng.random((3, len(active)), dtype=np.float32)
+
+        # feed_pet: голодного питомца кормим, сытого - нет
+        feed = (rolls[0] < self.p_feed) & (hunger > 0)
+        hunger[feed] = np.maximum(hunger[feed] - pet_config.FEED_HUNGER_DECREASE, 0)
+        health[feed] = np.minimum(health[feed] + pet_config.FEED_HEALTH_INCREASE, STAT_MAX)
+        happiness[feed] = np.minimum(happiness[feed] + pet_config.FEED_HAPPINESS_INCREASE, STAT_MAX)
+
+        # play_with_pet
+        play = rolls[1] < self.p_play
+        happiness[play] = np.minimum(happiness[play] + pet_config.PLAY_HAPPINESS_INCREASE, STAT_MAX)
+        hunger[play] = np.minimum(hunger[play] + pet_config.PLAY_HUNGER_INCREASE, STAT_MAX)
+
+        # clean_pet_area
+        clean = rolls[2] < self.p_clean
+        health[clean] = np.minimum(health[clean] + pet_config.CLEAN_HEALTH_INCREASE, STAT_MAX)
+        happiness[clean] = np.minimum(happiness[clean] + pet_config.CLEAN_HAPPINESS_INCREASE, STAT_MAX)
+
+        self.health[active] = health
+        self.happiness[active] = happiness
+        self.hunger[active] = hunger
+
+        self.action_counts["feed"] += int(feed.sum())
+        self.action_counts["play"] += int(play.sum())
+        self.action_counts["clean"] += int(clean.sum())
+
+    def _compact(self):
+        # Убираем умерших питомцев из всех массивов, чтобы не тратить на них время
+        if self.alive.all():
+            return
+        keep = self.alive
+        self.health = self.health[keep]
+        self.happiness = self.happiness[keep]
+        self.hunger = self.hunger[keep]
+        self.playing = self.playing[keep]
+        self.engagement = self.engagement[keep]
+        self.night_engagement = self.night_engagement[keep]
+        self.alive = np.ones(len(self.health), dtype=bool)
+
+    def _daily(self):
+        self._compact()
+        churned = self.rng.random(len(self.playing), dtype=np.float32) < self.churn_per_day
+        self.playing &= ~churned
+        if self.daily_bonus > 0:
+            claimed = self.playing & (self.rng.random(len(self.playing), dtype=np.float32) < self.p_daily_bonus)
+            self.total_emitted += int(claimed.sum()) * self.daily_bonus
+
+    def step(self):
+        day, seconds_of_day = divmod(self.step_count * self.step_seconds, SECONDS_PER_DAY)
+        for _ in range(day - self._day): # Шаг длиннее суток пересекает несколько границ
+            self._daily()
+        self._day = day
+        hour_of_day = seconds_of_day // SECONDS_PER_HOUR
+        self._degrade()
+        self._act(hour_of_day)
+
+        died = self.alive & (self.health <= 0)
+        deaths = int(np.count_nonzero(died))
+        if deaths:
+            self.alive &= ~died
+            self.deaths_total += deaths
+        self.step_count += 1
+        return deaths
+
+    def snapshot(self):
+        self._compact()
+        result = {
+            "step": self.step_count,
+            "alive": len(self.health),
+            "playing": int(np.count_nonzero(self.playing)),
+            "deaths_total": self.deaths_total,
+            "death_rate": self.deaths_total / self.num_pets,
+            "total_emitted": self.total_emitted,
+            "initial_grant_total": self.initial_grant_total,
+        }
+        for name, values in (("health", self.health), ("happiness", self.happiness), ("hunger", self.hunger)):
+            if len(values):
+                p10, p50, p90 = np.percentile(values, [10, 50, 90])
+                result[name] = {"mean": float(values.mean()), "p10": float(p10), "p50": float(p50), "p90": float(p90)}
+            else:
+                result[name] = {"mean": 0.0, "p10": 0.0, "p50": 0.0, "p90": 0.0}
+        return result
+
+    def run(self, days, report_every_days=1):
+        # Возвращает список снимков состояния в конце каждого report_every_days-го дня и в конце прогона
+        if days < 1:
+            raise ValueError(f"Simulation must run for at least 1 day, got {days}.")
+        if report_every_days < 1:
+            raise ValueError(f"Report interval must be at least 1 day, got {report_every_days}.")
+        snapshots = []
+        for day in range(1, days + 1):
+            # Шагаем до конца суток day; длина шага не обязана делить сутки нацело
+            while self.step_count * self.step_seconds < day * SECONDS_PER_DAY:
+                self.step()
+            if day % report_every_days == 0 or day == days:
+                snapshot = self.snapshot()
+                snapshot["day"] = day
+                snapshots.append(snapshot)
+        return snapshots
+
+
+def print_report(snapshots, num_pets, elapsed):
+    print(f"Simulated {num_pets} pets for {snapshots[-1]['day'] if snapshots else 0} days in {elapsed:.1f}s")
+    if snapshots and snapshots[-1]["initial_grant_total"]:
+        print(f"Hypothetical starting grant (not in emitted): {snapshots[-1]['initial_grant_total']}")
+    print(f"{'day':>4} {'alive':>10} {'playing':>10} {'death%':>7} {'emitted':>14}  "
+          f"{'health mean/p10/p50':>20}  {'happy mean/p10/p50':>20}  {'hunger mean/p50/p90':>20}")
+    for s in snapshots:
+        health, happiness, hunger = s["health"], s["happiness"], s["hunger"]
+        print(
+            f"{s['day']:>4} {s['alive']:>10} {s['playing']:>10} {s['death_rate'] * 100:>6.2f}% {s['total_emitted']:>14}  "
+            f"{health['mean']:>8.1f}/{health['p10']:>4.0f}/{health['p50']:>4.0f}  "
+            f"{happiness['mean']:>10.1f}/{happiness['p10']:>4.0f}/{happiness['p50']:>4.0f}  "
+            f"{hunger['mean']:>10.1f}/{hunger['p50']:>4.0f}/{hunger['p90']:>4.0f}"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Vectorized Tamacoin pet economy simulator.")
+    parser.add_argument("--pets", type=int, default=1_000_000, help="Population size")
+    parser.add_argument("--weeks", type=float, default=4, help="Simulated duration in weeks")
+    parser.add_argument("--report-every", type=int, default=1, help="Report interval in days")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--engagement", type=float, default=0.15, help="Mean probability that a player is active in a given hour")
+    parser.add_argument("--p-feed", type=float, default=0.6)
+    parser.add_argument("--p-play", type=float, default=0.5)
+    parser.add_argument("--p-clean", type=float, default=0.3)
+    parser.add_argument("--churn", type=float, default=0.02, help="Daily probability that a player quits")
+    parser.add_argument("--daily-bonus", type=int, default=0, help="Tamacoin per claimed daily bonus (not implemented in the bot yet)")
+    parser.add_argument("--initial-grant", type=int, default=0,
+                        help=f"Hypothetical Tamacoin per new player, e.g. INITIAL_TA_COIN={pet_config.INITIAL_TA_COIN} "
+                             f"(the bot does not grant it yet); reported separately from emitted")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    days = int(args.weeks * 7)
+    if days < 1:
+        raise SystemExit(f"--weeks {args.weeks} is shorter than one simulated day.")
+    simulator = EconomySimulator(
+        args.pets,
+        seed=args.seed,
+        mean_engagement=args.engagement,
+        p_feed=args.p_feed,
+        p_play=args.p_play,
+        p_clean=args.p_clean,
+        churn_per_day=args.churn,
+        daily_bonus=args.daily_bonus,
+        initial_grant=args.initial_grant,
+    )
+    started_at = time.monotonic()
+    snapshots = simulator.run(days, report_every_days=args.report_every)
+    print_report(snapshots, args.pets, time.monotonic() - started_at)
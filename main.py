@@ -1,12 +1,16 @@
 import os
 import logging
 from telegram import Update, InputFile, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, ApplicationHandlerStop, filters
 from datetime import datetime, timedelta
 
-from db_manager import DBManager # Импортируем класс DBManager
+from storage import AsyncStorage, create_storage # PostgreSQL (DBManager) или in-memory, см. STORAGE_BACKEND
 import pet_config # Убедитесь, что этот файл существует и содержит PET_TYPES_DISPLAY, PET_IDS, PET_IMAGES
 from game_logic import PetGame # Импортируем класс PetGame
+from update_guard import UpdateDeduplicator
+from admission import AdmissionController
+from update_capture import UpdateCapture, CapturingUpdateQueue
+from profiling import HandlerProfiler
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -16,23 +20,69 @@ logger = logging.getLogger(__name__)
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 WEBHOOK_HOST = os.getenv("WEBHOOK_HOST")
 
-if not TOKEN or not WEBHOOK_HOST:
-    logger.error("API_TOKEN or WEBHOOK_HOST environment variable not set.")
-    raise ValueError("API_TOKEN or WEBHOOK_HOST environment variable not set.")
-
 PORT = int(os.environ.get('PORT', 10000))
 
-# Инициализация DBManager (синглтон)
-db_manager = DBManager()
+# Идемпотентность вебхуков: "memory" (по умолчанию) или "db" для запуска в нескольких процессах
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "memory")
+DEDUP_WINDOW_SIZE = int(os.getenv("DEDUP_WINDOW_SIZE", 10000))
+
+# Контроль нагрузки: сколько апдейтов обрабатываем одновременно и сколько держим в очереди
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", 16))
+MAX_QUEUED_UPDATES = int(os.getenv("MAX_QUEUED_UPDATES", 100))
+DB_TARGET_LATENCY_MS = float(os.getenv("DB_TARGET_LATENCY_MS", 100))
+DB_OVERLOAD_LATENCY_MS = float(os.getenv("DB_OVERLOAD_LATENCY_MS", 500))
+# Лимит python-telegram-bot намеренно большой: апдейт должен сразу дойти до AdmissionController,
+# который сам решает - выполнить, поставить в очередь или ответить "занято".
+# При маленьком лимите лишние апдейты ждали бы в неограниченной очереди PTB и сброс нагрузки запаздывал бы
+PTB_CONCURRENT_UPDATES = int(os.getenv("PTB_CONCURRENT_UPDATES", 4096))
+
+# Если задан, все входящие апдейты пишутся в сжатый NDJSON-файл (для replay_updates.py)
+UPDATE_CAPTURE_PATH = os.getenv("UPDATE_CAPTURE_PATH")
 
-# Инициализация PetGame с экземпляром DBManager. Объект бота будет передаваться в методы PetGame.
+# Telegram ID администраторов через запятую (доступ к /profile)
+ADMIN_TELEGRAM_IDS = {int(admin_id) for admin_id in os.getenv("ADMIN_TELEGRAM_IDS", "").split(",") if admin_id.strip()}
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+# Инициализация хранилища (для PostgreSQL - синглтон DBManager).
+# Обработчики работают с ним через AsyncStorage: запросы к БД идут в пуле потоков, не блокируя event loop
+db_manager = AsyncStorage(create_storage())
+
+# Инициализация PetGame с экземпляром хранилища. Объект бота будет передаваться в методы PetGame.
 game_instance = PetGame(db_manager)
 
+# Отсекаем повторные доставки одного и того же update_id
+update_deduplicator = UpdateDeduplicator(
+    window_size=DEDUP_WINDOW_SIZE,
+    db_manager=db_manager if DEDUP_BACKEND == "db" else None
+)
+
+# Ограничение параллельности и сброс низкоприоритетных команд при медленной БД
+admission_controller = AdmissionController(
+    db_manager,
+    max_concurrency=MAX_CONCURRENT_UPDATES,
+    max_queue=MAX_QUEUED_UPDATES,
+    target_latency_ms=DB_TARGET_LATENCY_MS,
+    overload_latency_ms=DB_OVERLOAD_LATENCY_MS
+)
+
+update_capture = UpdateCapture(UPDATE_CAPTURE_PATH) if UPDATE_CAPTURE_PATH else None
+
+# Профилирование обработчиков по команде /profile (выключено по умолчанию)
+handler_profiler = HandlerProfiler(output_dir=PROFILE_DIR)
+
 # --- Текстовые константы ---
 START_MESSAGE = "Добро пожаловать в Tamacoin Game! Выберите своего первого питомца:"
 SELECT_PET_MESSAGE = "Кого вы хотите завести?"
 SHOP_CLOSED_MESSAGE = "Магазин пока закрыт на реконструкцию. Заходите позже!"
 DAILY_BONUS_UNAVAILABLE = "Ежедневный бонус будет доступен скоро! (Логика пока не реализована)"
+PROFILE_USAGE = (
+    "Использование:\n"
+    "/profile time <секунд> [доля апдейтов] - профилировать в течение времени\n"
+    "/profile updates <N> [доля апдейтов] - профилировать N апдейтов\n"
+    "/profile stop - остановить и сохранить результаты\n"
+    "/profile - текущее состояние"
+)
+DB_UNAVAILABLE_MESSAGE = "База данных временно недоступна. Команда /status показывает последнее известное состояние питомца, остальные действия - чуть позже."
 INFO_TEXT = """
 **TAMACOIN Game - Играй, развивай, зарабатывай!**
 
@@ -63,20 +113,24 @@ Tamacoin - это не просто игровая валюта, это наст
 # --- Функции-обработчики команд ---
 
 async def start_command(update: Update, context):
+    if not db_manager.is_available():
+        await update.message.reply_text(DB_UNAVAILABLE_MESSAGE)
+        return
+
     telegram_id = update.effective_user.id
     username = update.effective_user.username
     first_name = update.effective_user.first_name
     last_name = update.effective_user.last_name
 
-    user = db_manager.get_user(telegram_id)
+    user = await db_manager.get_user(telegram_id)
     if user is None:
-        internal_user_id = db_manager.add_user(telegram_id, username, first_name, last_name)
+        internal_user_id = await db_manager.add_user(telegram_id, username, first_name, last_name)
         logger.info(f"New user registered: {telegram_id}")
     else:
         internal_user_id = user[0] # Получаем внутренний ID пользователя
         logger.info(f"User {telegram_id} already exists. Checking for pet.")
 
-    pet = db_manager.get_pet(internal_user_id)
+    pet = await db_manager.get_pet(internal_user_id)
     if pet is None:
         keyboard = [
             [InlineKeyboardButton(pet_config.PET_TYPES_DISPLAY[pet_id], callback_data=f"select_pet_{pet_id}")
@@ -92,10 +146,14 @@ async def start_command(update: Update, context):
 async def button_callback_handler(update: Update, context):
     query = update.callback_query
     await query.answer() # Важно ответить на callback_query, чтобы кнопка перестала мигать
+
+    if not db_manager.is_available():
+        await query.edit_message_text(DB_UNAVAILABLE_MESSAGE)
+        return
     
     telegram_id = query.from_user.id
     
-    user_record = db_manager.get_user(telegram_id)
+    user_record = await db_manager.get_user(telegram_id)
     if user_record:
         internal_user_id = user_record[0]
     else:
@@ -114,13 +172,13 @@ async def button_callback_handler(update: Update, context):
         pet_type_for_db = pet_id_from_callback # Для базы данных используем ID ('toothless')
         pet_display_name = pet_config.PET_TYPES_DISPLAY.get(pet_id_from_callback) # Для отображения используем русское имя
         
-        existing_pet = db_manager.get_pet(internal_user_id)
+        existing_pet = await db_manager.get_pet(internal_user_id)
         if existing_pet:
             await query.edit_message_text(f"У вас уже есть питомец: {existing_pet[3]} ({existing_pet[2]}).")
             await game_instance.send_pet_status(query.message.chat_id, internal_user_id, context.bot)
             return
 
-        success = db_manager.create_pet(internal_user_id, pet_type_for_db, pet_display_name)
+        success = await db_manager.create_pet(internal_user_id, pet_type_for_db, pet_display_name)
         if success:
             await query.edit_message_text(f"Поздравляем! Вы завели питомца: {pet_display_name} ({pet_type_for_db}).")
             
@@ -137,55 +195,67 @@ async def button_callback_handler(update: Update, context):
 
 async def status_command(update: Update, context):
     telegram_id = update.effective_user.id
-    user = db_manager.get_user(telegram_id)
+    user = await db_manager.get_user(telegram_id)
     if user is None:
         await update.message.reply_text("Пожалуйста, начните игру с команды /start.")
         return
 
     internal_user_id = user[0]
-    pet = db_manager.get_pet(internal_user_id)
+    pet = await db_manager.get_pet(internal_user_id)
     if pet is None:
         await update.message.reply_text("У вас еще нет питомца! Выберите его, используя команду /start.")
     else:
         await game_instance.send_pet_status(update.effective_chat.id, internal_user_id, context.bot)
 
 async def feed_command(update: Update, context):
+    if not db_manager.is_available():
+        await update.message.reply_text(DB_UNAVAILABLE_MESSAGE)
+        return
+
     telegram_id = update.effective_user.id
-    user = db_manager.get_user(telegram_id)
+    user = await db_manager.get_user(telegram_id)
     if user is None:
         await update.message.reply_text("Пожалуйста, начните игру с команды /start.")
         return
 
     internal_user_id = user[0]
-    pet = db_manager.get_pet(internal_user_id)
+    pet = await db_manager.get_pet(internal_user_id)
     if pet is None:
         await update.message.reply_text("У вас еще нет питомца! Выберите его, используя команду /start.")
     else:
         await game_instance.feed_pet(update.effective_chat.id, internal_user_id, context.bot)
 
 async def play_command(update: Update, context):
+    if not db_manager.is_available():
+        await update.message.reply_text(DB_UNAVAILABLE_MESSAGE)
+        return
+
     telegram_id = update.effective_user.id
-    user = db_manager.get_user(telegram_id)
+    user = await db_manager.get_user(telegram_id)
     if user is None:
         await update.message.reply_text("Пожалуйста, начните игру с команды /start.")
         return
 
     internal_user_id = user[0]
-    pet = db_manager.get_pet(internal_user_id)
+    pet = await db_manager.get_pet(internal_user_id)
     if pet is None:
         await update.message.reply_text("У вас еще нет питомца! Выберите его, используя команду /start.")
     else:
         await game_instance.play_with_pet(update.effective_chat.id, internal_user_id, context.bot)
 
 async def clean_command(update: Update, context):
+    if not db_manager.is_available():
+        await update.message.reply_text(DB_UNAVAILABLE_MESSAGE)
+        return
+
     telegram_id = update.effective_user.id
-    user = db_manager.get_user(telegram_id)
+    user = await db_manager.get_user(telegram_id)
     if user is None:
         await update.message.reply_text("Пожалуйста, начните игру с команды /start.")
         return
 
     internal_user_id = user[0]
-    pet = db_manager.get_pet(internal_user_id)
+    pet = await db_manager.get_pet(internal_user_id)
     if pet is None:
         await update.message.reply_text("У вас еще нет питомца! Выберите его, используя команду /start.")
     else:
@@ -201,14 +271,22 @@ async def info_command(update: Update, context):
     await update.message.reply_text(INFO_TEXT, parse_mode='Markdown')
 
 async def users_count_command(update: Update, context):
-    count = db_manager.get_total_users_count()
+    if not db_manager.is_available():
+        await update.message.reply_text(DB_UNAVAILABLE_MESSAGE)
+        return
+
+    count = await db_manager.get_total_users_count()
     await update.message.reply_text(f"Общее количество пользователей: {count}.")
 
 async def admin_stats_command(update: Update, context):
+    if not db_manager.is_available():
+        await update.message.reply_text(DB_UNAVAILABLE_MESSAGE)
+        return
+
     # !!! Важно: в реальном приложении нужно добавить проверку на администратора !!!
     # Например: if update.effective_user.id != YOUR_ADMIN_TELEGRAM_ID: return
     
-    stats = db_manager.get_game_stats()
+    stats = await db_manager.get_game_stats()
     if stats:
         await update.message.reply_text(
             f"Административная статистика:\n"
@@ -218,39 +296,118 @@ async def admin_stats_command(update: Update, context):
     else:
         await update.message.reply_text("Произошла ошибка при получении административной статистики.")
 
+async def profile_command(update: Update, context):
+    if update.effective_user.id not in ADMIN_TELEGRAM_IDS:
+        await update.message.reply_text("Эта команда доступна только администраторам.")
+        return
+
+    args = context.args or []
+    if not args:
+        state = "включено" if handler_profiler.active else "выключено"
+        last_files = "\n".join(handler_profiler.last_written) or "нет"
+        await update.message.reply_text(
+            f"Профилирование {state}. Собрано по обработчикам: {handler_profiler.summary()}\n"
+            f"Файлы последней сессии:\n{last_files}\n\n{PROFILE_USAGE}"
+        )
+        return
+
+    if args[0] == "stop":
+        written = handler_profiler.stop()
+        if written:
+            await update.message.reply_text("Профили сохранены:\n" + "\n".join(written))
+        else:
+            await update.message.reply_text("Профилирование не было запущено или не собрало данных.")
+        return
+
+    try:
+        mode, amount = args[0], int(args[1])
+        sample_rate = float(args[2]) if len(args) > 2 else 1.0
+    except (IndexError, ValueError):
+        await update.message.reply_text(PROFILE_USAGE)
+        return
+    if mode not in ("time", "updates") or amount <= 0 or not 0 < sample_rate <= 1:
+        await update.message.reply_text(PROFILE_USAGE)
+        return
+
+    started = handler_profiler.start(
+        duration_seconds=amount if mode == "time" else None,
+        max_updates=amount if mode == "updates" else None,
+        sample_rate=sample_rate
+    )
+    if started:
+        await update.message.reply_text(f"Профилирование запущено. Результаты будут сохранены в {PROFILE_DIR}/.")
+    else:
+        await update.message.reply_text("Профилирование уже запущено. Остановите его командой /profile stop.")
+
 async def echo(update: Update, context):
     await update.message.reply_text("Я не понимаю этой команды. Используйте /help для списка команд.")
 
+async def drop_duplicate_updates(update: Update, context):
+    # Выполняется раньше всех обработчиков (группа -1). Дубликат дальше не проходит.
+    if not await update_deduplicator.is_new(update.update_id):
+        raise ApplicationHandlerStop
+
+async def close_update_capture(application):
+    update_capture.close()
+
 # >>> НОВАЯ ФУНКЦИЯ ДЛЯ ОТЛАДКИ ВСЕХ ОБНОВЛЕНИЙ <<<
 async def log_all_updates(update: Update, context):
     logger.info(f"Received raw Update: {update.to_dict()}")
 
-def main():
-    application = Application.builder().token(TOKEN).build()
+def register_handlers(application):
+    # Общая регистрация обработчиков: используется и ботом, и replay_updates.py
+    # Защита от повторных доставок вебхука - до любых других обработчиков
+    application.add_handler(TypeHandler(Update, drop_duplicate_updates), group=-1)
+
+    profiled = handler_profiler.wrap
+
+    def admit(callback, low_priority=False):
+        # Профилируем внутри контроля нагрузки, чтобы ожидание в очереди не попадало в профиль
+        return admission_controller.wrap(profiled(callback), low_priority=low_priority)
 
     # Обработчики команд
-    application.add_handler(CommandHandler("start", start_command))
-    application.add_handler(CommandHandler("status", status_command))
-    application.add_handler(CommandHandler("feed", feed_command))
-    application.add_handler(CommandHandler("play", play_command))
-    application.add_handler(CommandHandler("clean", clean_command))
-    application.add_handler(CommandHandler("shop", shop_command))
-    application.add_handler(CommandHandler("daily_bonus", daily_bonus_command))
-    application.add_handler(CommandHandler("info", info_command))
-    application.add_handler(CommandHandler("users_count", users_count_command))
-    application.add_handler(CommandHandler("admin_stats", admin_stats_command))
+    application.add_handler(CommandHandler("start", admit(start_command)))
+    application.add_handler(CommandHandler("status", admit(status_command)))
+    application.add_handler(CommandHandler("feed", admit(feed_command)))
+    application.add_handler(CommandHandler("play", admit(play_command)))
+    application.add_handler(CommandHandler("clean", admit(clean_command)))
+    application.add_handler(CommandHandler("shop", profiled(shop_command)))
+    application.add_handler(CommandHandler("daily_bonus", profiled(daily_bonus_command)))
+    # Низкоприоритетные команды первыми отбрасываются при перегрузке
+    application.add_handler(CommandHandler("info", admit(info_command, low_priority=True)))
+    application.add_handler(CommandHandler("users_count", admit(users_count_command, low_priority=True)))
+    application.add_handler(CommandHandler("admin_stats", admit(admin_stats_command, low_priority=True)))
+    # Команда администратора: вне контроля нагрузки, чтобы профилирование включалось и под перегрузкой
+    application.add_handler(CommandHandler("profile", profile_command))
 
     # Обработчик callback-кнопок
-    application.add_handler(CallbackQueryHandler(button_callback_handler))
+    application.add_handler(CallbackQueryHandler(admit(button_callback_handler)))
 
     # Обработчик для всех остальных текстовых сообщений, которые не являются командами
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, echo))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, profiled(echo)))
 
     # >>> ЭТА НОВАЯ СТРОКА ОЧЕНЬ ВАЖНА ДЛЯ ДИАГНОСТИКИ <<<
     # Добавляем обработчик, который логирует ВСЕ входящие обновления.
     # Он должен быть после всех других более специфичных обработчиков.
     application.add_handler(MessageHandler(filters.ALL, log_all_updates))
 
+def build_application(builder):
+    # Настройки Application, общие для бота и тестов: builder уже содержит токен (и, в тестах, заглушку сети)
+    if update_capture is not None:
+        # Захват при постановке в очередь, до семафора concurrent_updates, включая повторные доставки вебхука
+        builder = builder.update_queue(CapturingUpdateQueue(update_capture))
+        builder = builder.post_shutdown(close_update_capture)
+    application = builder.concurrent_updates(PTB_CONCURRENT_UPDATES).build()
+    register_handlers(application)
+    return application
+
+def main():
+    if not TOKEN or not WEBHOOK_HOST:
+        logger.error("API_TOKEN or WEBHOOK_HOST environment variable not set.")
+        raise ValueError("API_TOKEN or WEBHOOK_HOST environment variable not set.")
+
+    application = build_application(Application.builder().token(TOKEN))
+
     # Запуск бота на Render с вебхуками
     application.run_webhook(
         listen="0.0.0.0",
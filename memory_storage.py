@@ -0,0 +1,151 @@
+# memory_storage.py
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryStorage(StorageBackend):
+    """
+    Хранилище в памяти процесса с той же семантикой, что и DBManager для PostgreSQL:
+    уникальный telegram_id, один питомец на владельца, счетчики game_stats.
+    Подходит для тестов обработчиков, бенчмарков и профилирования - без сервера БД.
+    Данные теряются при перезапуске процесса.
+    """
+
+    blocking = False # Операции занимают микросекунды: AsyncStorage вызывает их прямо в event loop
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users_by_id = {} # id -> list полей users
+        self._user_ids_by_telegram_id = {}
+        self._pets_by_id = {} # id -> list полей pets
+        self._pet_ids_by_owner_id = {}
+        self._processed_updates = {} # update_id -> processed_at
+        self._next_user_id = 1 # Аналог SERIAL
+        self._next_pet_id = 1
+        self._game_stats = {"total_emitted_tamacoin": 0, "total_users": 0}
+
+    def close(self):
+        logger.info("In-memory storage closed.")
+
+    def get_user(self, telegram_id):
+        with self._lock:
+            user_id = self._user_ids_by_telegram_id.get(telegram_id)
+            if user_id is None:
+                return None
+            return tuple(self._users_by_id[user_id])
+
+    def get_user_by_id(self, user_id):
+        with self._lock:
+            user = self._users_by_id.get(user_id)
+            return tuple(user) if user else None
+
+    def add_user(self, telegram_id, username, first_name, last_name):
+        with self._lock:
+            existing_id = self._user_ids_by_telegram_id.get(telegram_id)
+            if existing_id is not None:
+                logger.warning(f"User {telegram_id} already exists (add_user called but user exists).")
+                return existing_id
+            user_id = self._next_user_id
+            self._next_user_id += 1
+            self._users_by_id[user_id] = [user_id, telegram_id, username, first_name, last_name, 0, None]
+            self._user_ids_by_telegram_id[telegram_id] = user_id
+            self._game_stats["total_users"] += 1
+            return user_id
+
+    def update_user_balance(self, user_id, amount):
+        with self._lock:
+            user = self._users_by_id.get(user_id)
+            if user is None:
+                logger.error(f"Error updating user {user_id} balance: user not found")
+                return None
+            user[5] += amount
+            if amount > 0:
+                self._game_stats["total_emitted_tamacoin"] += amount
+            return user[5]
+
+    def update_user_daily_bonus_time(self, user_id):
+        with self._lock:
+            user = self._users_by_id.get(user_id)
+            if user is not None: # Как UPDATE в PostgreSQL: отсутствие строки не ошибка
+                user[6] = datetime.now()
+            return True
+
+    def create_pet(self, owner_id, pet_type, name):
+        with self._lock:
+            if owner_id not in self._users_by_id: # Аналог REFERENCES users(id)
+                logger.error(f"Error creating pet for owner_id {owner_id}: user not found")
+                return False
+            if owner_id in self._pet_ids_by_owner_id: # Аналог UNIQUE(owner_id)
+                logger.warning(f"Pet already exists for owner_id {owner_id}. Skipping creation.")
+                return False
+            pet_id = self._next_pet_id
+            self._next_pet_id += 1
+            now = datetime.now()
+            self._pets_by_id[pet_id] = [pet_id, owner_id, pet_type, name, 100, 100, 0, now, now, now, now]
+            self._pet_ids_by_owner_id[owner_id] = pet_id
+            return True
+
+    def get_pet(self, owner_id):
+        with self._lock:
+            pet_id = self._pet_ids_by_owner_id.get(owner_id)
+            if pet_id is None:
+                return None
+            return tuple(self._pets_by_id[pet_id])
+
+    def update_pet_stats(self, pet_id, health=None, happiness=None, hunger=None, last_fed=None, last_played=None, last_cleaned=None, last_interacted=None):
+        # Индексы полей такие же, как в кортеже питомца
+        updates = {}
+        if health is not None:
+            updates[4] = health
+        if happiness is not None:
+            updates[5] = happiness
+        if hunger is not None:
+            updates[6] = hunger
+        for index, value in ((7, last_fed), (8, last_played), (9, last_cleaned), (10, last_interacted)):
+            if value is not None:
+                updates[index] = value if isinstance(value, datetime) else datetime.now()
+
+        if not updates:
+            logger.warning(f"No stats to update for pet_id {pet_id}.")
+            return False
+
+        with self._lock:
+            pet = self._pets_by_id.get(pet_id)
+            if pet is not None: # Как UPDATE в PostgreSQL: отсутствие строки не ошибка
+                for index, value in updates.items():
+                    pet[index] = value
+            return True
+
+    def get_game_stats(self):
+        with self._lock:
+            return dict(self._game_stats)
+
+    def get_total_users_count(self):
+        with self._lock:
+            return len(self._users_by_id)
+
+    def mark_update_processed(self, update_id):
+        with self._lock:
+            if update_id in self._processed_updates:
+                return False
+            self._processed_updates[update_id] = datetime.now()
+            return True
+
+    def prune_processed_updates(self, max_age_hours=24):
+        with self._lock:
+            threshold = datetime.now() - timedelta(hours=max_age_hours)
+            stale_ids = [update_id for update_id, processed_at in self._processed_updates.items() if processed_at < threshold]
+            for update_id in stale_ids:
+                del self._processed_updates[update_id]
+            return True
+
+    def get_latency_ms(self):
+        return 0.0
+
+    def is_available(self):
+        return True
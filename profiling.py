@@ -0,0 +1,127 @@
+# profiling.py
+import asyncio
+import cProfile
+import functools
+import logging
+import os
+import pstats
+import random
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_DIR = "profiles"
+
+
+class HandlerProfiler:
+    """
+    Профилирование обработчиков по требованию (включается админом через /profile).
+
+    Пока профилирование выключено, обертка стоит одну проверку флага.
+    Во время сессии профилируется выборка апдейтов (sample_rate), не более одного одновременно:
+    cProfile привязан к потоку, и параллельные профили в одном event loop невозможны.
+    Пока профилируемый обработчик ждет в await, в профиль попадают и другие корутины -
+    поэтому профили стоит читать вместе с количеством собранных апдейтов.
+    Результаты агрегируются по обработчикам и сохраняются в .prof-файлы,
+    которые читаются стандартными инструментами: python -m pstats, snakeviz и т.п.
+    """
+
+    def __init__(self, output_dir=DEFAULT_PROFILE_DIR):
+        self.output_dir = output_dir
+        self._active = False
+        self._busy = False # Сейчас профилируется один из апдейтов
+        self._deadline = None
+        self._updates_remaining = None
+        self._sample_rate = 1.0
+        self._stats_by_handler = {}
+        self._counts_by_handler = {}
+        self._timer = None
+        self._session = 0 # Номер сессии в имени файла: две сессии за одну секунду не перезапишут друг друга
+        self.last_written = [] # Файлы последней сессии, в том числе остановленной таймером или лимитом
+
+    @property
+    def active(self):
+        return self._active
+
+    def start(self, duration_seconds=None, max_updates=None, sample_rate=1.0):
+        # Должен вызываться из работающего event loop (из обработчика команды)
+        if self._active:
+            return False
+        self._active = True
+        self._session += 1
+        self._deadline = time.monotonic() + duration_seconds if duration_seconds else None
+        self._updates_remaining = max_updates
+        self._sample_rate = sample_rate
+        self._stats_by_handler = {}
+        self._counts_by_handler = {}
+        if duration_seconds:
+            self._timer = asyncio.get_running_loop().call_later(duration_seconds, self.stop)
+        logger.info(f"Handler profiling started (duration: {duration_seconds}s, updates: {max_updates}, sample rate: {sample_rate}).")
+        return True
+
+    def stop(self):
+        # Выключает профилирование и сохраняет результаты; возвращает список записанных файлов
+        if not self._active:
+            return []
+        self._active = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        written = []
+        for handler_name, stats in self._stats_by_handler.items():
+            path = os.path.join(self.output_dir, f"{handler_name}_{stamp}_s{self._session}.prof")
+            stats.dump_stats(path)
+            written.append(path)
+            logger.info(f"Profile for {handler_name} ({self._counts_by_handler[handler_name]} updates) written to {path}.")
+        self._stats_by_handler = {}
+        self.last_written = written
+        logger.info(f"Handler profiling stopped, {len(written)} profile files written: {written}")
+        return written
+
+    def summary(self):
+        return dict(self._counts_by_handler)
+
+    def _should_sample(self):
+        if self._busy:
+            return False
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            self.stop()
+            return False
+        return random.random() < self._sample_rate
+
+    def _record(self, handler_name, profile):
+        stats = self._stats_by_handler.get(handler_name)
+        if stats is None:
+            self._stats_by_handler[handler_name] = pstats.Stats(profile)
+        else:
+            stats.add(profile)
+        self._counts_by_handler[handler_name] = self._counts_by_handler.get(handler_name, 0) + 1
+
+        if self._updates_remaining is not None:
+            self._updates_remaining -= 1
+            if self._updates_remaining <= 0:
+                self.stop()
+
+    def wrap(self, handler):
+        @functools.wraps(handler)
+        async def wrapped(update, context):
+            if not self._active or not self._should_sample():
+                return await handler(update, context)
+
+            self._busy = True
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+                try:
+                    return await handler(update, context)
+                finally:
+                    profile.disable()
+            finally:
+                self._busy = False
+                if self._active: # Сессия могла закончиться, пока обработчик работал
+                    self._record(handler.__name__, profile)
+        return wrapped
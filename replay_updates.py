@@ -0,0 +1,193 @@
+# replay_updates.py
+"""
+Проигрывание захваченных апдейтов (см. UPDATE_CAPTURE_PATH в main.py) через настоящий
+Application и все обработчики бота - для нагрузочного тестирования на реальной форме трафика.
+
+Запросы к Telegram API не уходят в сеть: их перехватывает ReplayRequest и возвращает
+правдоподобные ответы. Хранилище настоящее, а проигрывание пишет в него (регистрации, питомцы),
+поэтому DATABASE_URL из окружения игнорируется: тестовая база задается явно через --database-url
+и должна быть локальной. Удаленный хост разрешается только с --allow-remote-db.
+С STORAGE_BACKEND=memory проигрывание идет без PostgreSQL и измеряет накладные расходы самих обработчиков.
+
+Примеры:
+    python replay_updates.py updates.ndjson.gz --database-url postgresql://localhost/tamacoin_replay
+    python replay_updates.py updates.ndjson.gz --database-url postgresql://localhost/tamacoin_replay --speed 10
+    STORAGE_BACKEND=memory python replay_updates.py updates.ndjson.gz --speed 0   # максимально быстро, без БД
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+# Повторный захват во время проигрывания не нужен
+os.environ.pop("UPDATE_CAPTURE_PATH", None)
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+from storage import STORAGE_BACKEND
+from update_capture import read_capture
+
+logger = logging.getLogger(__name__)
+
+REPLAY_TOKEN = "123456:REPLAY"
+REPLAY_BOT_USER = {"id": 123456, "is_bot": True, "first_name": "ReplayBot", "username": "replay_bot"}
+
+# Хосты, которые считаются локальной тестовой базой; пути (начинаются с "/") - unix-сокеты
+LOCAL_DATABASE_HOSTS = {"", "localhost", "127.0.0.1", "::1"}
+
+# Методы Bot API, которые возвращают Message, а не True
+MESSAGE_RETURNING_METHODS = {"sendMessage", "sendPhoto", "editMessageText", "editMessageReplyMarkup"}
+
+
+class ReplayRequest(BaseRequest):
+    """Заглушка сетевого слоя python-telegram-bot: отвечает на вызовы Bot API без обращения к Telegram."""
+
+    def __init__(self):
+        self._message_id = 0
+        self.calls = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        api_method = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data is not None else {}
+
+        if api_method == "getMe":
+            result = REPLAY_BOT_USER
+        elif api_method in MESSAGE_RETURNING_METHODS:
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": parameters.get("chat_id") or 0, "type": "private"},
+                "text": parameters.get("text") or parameters.get("caption") or "",
+            }
+        else:
+            result = True
+
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+def _database_hosts(database_url):
+    # parse_dsn понимает оба формата libpq: URI (postgresql://host/db) и "host=... dbname=..."
+    from psycopg2.extensions import parse_dsn
+    return parse_dsn(database_url).get("host", "").split(",")
+
+
+def _configure_database(database_url, allow_remote_db):
+    # Проигрывание пишет в базу, поэтому она задается только явно и по умолчанию только локальная
+    if STORAGE_BACKEND == "memory":
+        return
+    if not database_url:
+        raise SystemExit("--database-url is required for replay (or use STORAGE_BACKEND=memory).")
+    try:
+        hosts = _database_hosts(database_url)
+    except Exception as e:
+        raise SystemExit(f"Invalid --database-url: {e}")
+    remote_hosts = [host for host in hosts if host not in LOCAL_DATABASE_HOSTS and not host.startswith("/")]
+    if remote_hosts and not allow_remote_db:
+        raise SystemExit(f"Refusing to replay into remote database host(s) {remote_hosts}; pass --allow-remote-db to override.")
+    os.environ["DATABASE_URL"] = database_url
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def replay(path, speed, limit=None):
+    # Импорт после _configure_database: main.py подключается к хранилищу при импорте
+    import main as bot_main
+
+    application = (
+        Application.builder()
+        .token(REPLAY_TOKEN)
+        .request(ReplayRequest())
+        .get_updates_request(ReplayRequest())
+        .updater(None)
+        .build()
+    )
+    latencies = []
+    failures = 0
+
+    async def count_failure(update, context):
+        # process_update не пробрасывает исключения обработчиков, а передает их сюда
+        nonlocal failures
+        failures += 1
+        logger.warning(f"Update {getattr(update, 'update_id', None)} failed during replay: {context.error}")
+
+    bot_main.register_handlers(application)
+    application.add_error_handler(count_failure)
+    await application.initialize()
+
+    semaphore = asyncio.Semaphore(bot_main.PTB_CONCURRENT_UPDATES) # Та же параллельность, что и в боте
+
+    async def process(update, dispatched_at):
+        async with semaphore:
+            await application.process_update(update)
+        latencies.append(time.monotonic() - dispatched_at)
+
+    tasks = []
+    first_ts = None
+    started_at = time.monotonic()
+    for count, record in enumerate(read_capture(path)):
+        if limit is not None and count >= limit:
+            break
+        if speed > 0:
+            if first_ts is None:
+                first_ts = record["ts"]
+            delay = started_at + (record["ts"] - first_ts) / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        update = Update.de_json(record["update"], application.bot)
+        tasks.append(asyncio.create_task(process(update, time.monotonic())))
+
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - started_at
+    await application.shutdown()
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"Replayed updates: {total} from {path} (speed: {'max' if speed <= 0 else f'{speed}x'})")
+    print(f"Elapsed: {elapsed:.2f}s, throughput: {total / elapsed if elapsed > 0 else 0:.1f} updates/s")
+    print(
+        f"Latency ms: p50={_percentile(latencies, 50) * 1000:.1f} "
+        f"p95={_percentile(latencies, 95) * 1000:.1f} "
+        f"p99={_percentile(latencies, 99) * 1000:.1f} "
+        f"max={(latencies[-1] if latencies else 0) * 1000:.1f}"
+    )
+    print(f"Failed updates: {failures}, shed by admission control: {bot_main.admission_controller.shed_count}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay captured Telegram updates through the bot handlers.")
+    parser.add_argument("capture", help="Path to a .ndjson.gz capture written with UPDATE_CAPTURE_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed multiplier, 0 = as fast as possible")
+    parser.add_argument("--limit", type=int, default=None, help="Replay only the first N updates")
+    parser.add_argument("--log-level", default="WARNING", help="Logging level during replay")
+    parser.add_argument("--database-url", default=None, help="Test database to replay into (DATABASE_URL from the environment is ignored)")
+    parser.add_argument("--allow-remote-db", action="store_true", help="Allow --database-url pointing to a non-local host")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    _configure_database(args.database_url, args.allow_remote_db)
+    logging.getLogger().setLevel(args.log_level.upper())
+    asyncio.run(replay(args.capture, args.speed, args.limit))
@@ -0,0 +1,174 @@
+# storage.py
+import os
+import asyncio
+import functools
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# "postgres" (по умолчанию) или "memory" - быстрый backend для тестов, бенчмарков и профилирования
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "postgres")
+
+
+class StorageBackend(ABC):
+    """
+    Интерфейс хранилища, с которым работают PetGame и обработчики main.py.
+
+    Формат данных общий для всех реализаций:
+    * пользователь - кортеж (id, telegram_id, username, first_name, last_name, balance, last_daily_bonus);
+    * питомец - кортеж (id, owner_id, pet_type, name, health, happiness, hunger,
+      last_fed, last_played, last_cleaned, last_interacted).
+    Методы не бросают исключений: при ошибке возвращают None/False, как DBManager.
+    """
+
+    blocking = True # Методы ходят в сеть/на диск и не должны вызываться в потоке event loop
+    max_connections = 1 # Сколько вызовов backend может выполнять одновременно
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    @abstractmethod
+    def get_user(self, telegram_id):
+        pass
+
+    @abstractmethod
+    def get_user_by_id(self, user_id):
+        pass
+
+    @abstractmethod
+    def add_user(self, telegram_id, username, first_name, last_name):
+        pass
+
+    @abstractmethod
+    def update_user_balance(self, user_id, amount):
+        pass
+
+    @abstractmethod
+    def update_user_daily_bonus_time(self, user_id):
+        pass
+
+    @abstractmethod
+    def create_pet(self, owner_id, pet_type, name):
+        pass
+
+    @abstractmethod
+    def get_pet(self, owner_id):
+        pass
+
+    @abstractmethod
+    def update_pet_stats(self, pet_id, health=None, happiness=None, hunger=None, last_fed=None, last_played=None, last_cleaned=None, last_interacted=None):
+        pass
+
+    @abstractmethod
+    def get_game_stats(self):
+        pass
+
+    @abstractmethod
+    def get_total_users_count(self):
+        pass
+
+    @abstractmethod
+    def mark_update_processed(self, update_id):
+        pass
+
+    @abstractmethod
+    def prune_processed_updates(self, max_age_hours=24):
+        pass
+
+    @abstractmethod
+    def get_latency_ms(self):
+        pass
+
+    @abstractmethod
+    def is_available(self):
+        pass
+
+
+class AsyncStorage:
+    """
+    Асинхронная обертка над StorageBackend для обработчиков main.py и PetGame.
+
+    Блокирующие backend'ы (DBManager) вызываются в отдельном пуле потоков, поэтому медленный запрос
+    не останавливает event loop, а вместе с ним и сброс нагрузки в AdmissionController.
+    Потоков не больше, чем backend.max_connections: вызов никогда не ждет свободного соединения
+    внутри потока. Сколько запросов идет одновременно, на деле задает лимит AdmissionController -
+    каждый принятый апдейт обращается к хранилищу последовательно.
+    Неблокирующие backend'ы (InMemoryStorage) вызываются напрямую, без переключения потоков.
+    """
+
+    def __init__(self, backend, max_workers=None):
+        self.backend = backend
+        self._executor = None
+        if backend.blocking:
+            max_workers = min(max_workers or backend.max_connections, backend.max_connections)
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="storage")
+
+    async def _call(self, method, *args, **kwargs):
+        if self._executor is None:
+            return method(*args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self.backend.close()
+
+    async def get_user(self, telegram_id):
+        return await self._call(self.backend.get_user, telegram_id)
+
+    async def get_user_by_id(self, user_id):
+        return await self._call(self.backend.get_user_by_id, user_id)
+
+    async def add_user(self, telegram_id, username, first_name, last_name):
+        return await self._call(self.backend.add_user, telegram_id, username, first_name, last_name)
+
+    async def update_user_balance(self, user_id, amount):
+        return await self._call(self.backend.update_user_balance, user_id, amount)
+
+    async def update_user_daily_bonus_time(self, user_id):
+        return await self._call(self.backend.update_user_daily_bonus_time, user_id)
+
+    async def create_pet(self, owner_id, pet_type, name):
+        return await self._call(self.backend.create_pet, owner_id, pet_type, name)
+
+    async def get_pet(self, owner_id):
+        return await self._call(self.backend.get_pet, owner_id)
+
+    async def update_pet_stats(self, pet_id, **stats):
+        return await self._call(self.backend.update_pet_stats, pet_id, **stats)
+
+    async def get_game_stats(self):
+        return await self._call(self.backend.get_game_stats)
+
+    async def get_total_users_count(self):
+        return await self._call(self.backend.get_total_users_count)
+
+    async def mark_update_processed(self, update_id):
+        return await self._call(self.backend.mark_update_processed, update_id)
+
+    async def prune_processed_updates(self, max_age_hours=24):
+        return await self._call(self.backend.prune_processed_updates, max_age_hours)
+
+    # Не обращаются к БД, поэтому остаются синхронными
+    def get_latency_ms(self):
+        return self.backend.get_latency_ms()
+
+    def is_available(self):
+        return self.backend.is_available()
+
+
+def create_storage(backend=None):
+    # Импорты внутри функции: для in-memory backend psycopg2 не нужен
+    backend = backend or STORAGE_BACKEND
+    if backend == "memory":
+        from memory_storage import InMemoryStorage
+        logger.info("Using in-memory storage backend.")
+        return InMemoryStorage()
+    if backend == "postgres":
+        from db_manager import DBManager
+        return DBManager()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,159 @@
+# test_admission.py
+import asyncio
+import json
+import os
+import time
+import unittest
+
+# main.py создает хранилище и контроллер нагрузки при импорте: настраиваем их заранее
+os.environ["STORAGE_BACKEND"] = "memory"
+os.environ["MAX_CONCURRENT_UPDATES"] = "2"
+os.environ["MAX_QUEUED_UPDATES"] = "4"
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+import main as bot_main
+from admission import AdmissionController, BUSY_MESSAGE
+
+
+class FakeStorage:
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+
+    def get_latency_ms(self):
+        return self.latency_ms
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text):
+        self.replies.append(text)
+
+
+class FakeUpdate:
+    def __init__(self):
+        self.callback_query = None
+        self.effective_message = FakeMessage()
+
+
+async def slow_handler(update, context):
+    await asyncio.sleep(0.01)
+    return "ok"
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def run_burst(self, controller, size, low_priority=False):
+        async def burst():
+            wrapped = controller.wrap(slow_handler, low_priority=low_priority)
+            return await asyncio.gather(*[wrapped(FakeUpdate(), None) for _ in range(size)])
+        return asyncio.run(burst())
+
+    def test_burst_of_limit_plus_queue_is_fully_admitted(self):
+        controller = AdmissionController(FakeStorage(), max_concurrency=2, max_queue=4)
+        results = self.run_burst(controller, 2 + 4)
+        self.assertEqual(results, ["ok"] * 6)
+        self.assertEqual(controller.shed_count, 0)
+        self.assertEqual(controller._in_flight, 0)
+        self.assertEqual(controller._waiting, 0)
+
+    def test_burst_beyond_queue_sheds_only_the_excess(self):
+        controller = AdmissionController(FakeStorage(), max_concurrency=2, max_queue=4)
+        results = self.run_burst(controller, 2 + 4 + 3)
+        self.assertEqual(results.count("ok"), 6)
+        self.assertEqual(controller.shed_count, 3)
+
+    def test_requests_within_limit_do_not_count_as_queued(self):
+        controller = AdmissionController(FakeStorage(), max_concurrency=16, max_queue=4)
+        results = self.run_burst(controller, 16, low_priority=True)
+        self.assertEqual(results, ["ok"] * 16)
+        self.assertEqual(controller.shed_count, 0)
+
+    def test_low_priority_is_shed_when_db_is_slow(self):
+        controller = AdmissionController(FakeStorage(latency_ms=1000), overload_latency_ms=500)
+        results = self.run_burst(controller, 1, low_priority=True)
+        self.assertEqual(results, [None])
+        self.assertEqual(controller.shed_count, 1)
+
+
+class SlowTelegramRequest(BaseRequest):
+    """Заглушка Bot API: обычные ответы бота идут медленно, ответы "занято" - мгновенно."""
+
+    def __init__(self, reply_delay):
+        self.reply_delay = reply_delay
+        self.sent = [] # (время отправки, текст)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data is not None else {}
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "TestBot", "username": "test_bot"}
+        else:
+            text = parameters.get("text", "")
+            if text != BUSY_MESSAGE:
+                await asyncio.sleep(self.reply_delay)
+            self.sent.append((time.monotonic(), text))
+            result = {"message_id": len(self.sent), "date": 0, "chat": {"id": parameters.get("chat_id", 0), "type": "private"}, "text": text}
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+def command_update(update_id, command):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": update_id, "type": "private"},
+            "from": {"id": update_id, "is_bot": False, "first_name": "Player"},
+            "text": command,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }
+
+
+class ApplicationAdmissionTest(unittest.TestCase):
+    def test_overflow_gets_busy_reply_without_waiting_in_ptb(self):
+        # 2 апдейта выполняются, 4 ждут в очереди контроллера, остальные сразу получают "занято",
+        # включая низкоприоритетный /info - он отбрасывается уже при наполовину заполненной очереди
+        request = SlowTelegramRequest(reply_delay=0.2)
+
+        async def scenario():
+            application = bot_main.build_application(
+                Application.builder().token("1:TEST").request(request).get_updates_request(request).updater(None)
+            )
+            commands = ["/start"] * 6 + ["/info"] + ["/start"] * 3
+            async with application:
+                await application.start()
+                started_at = time.monotonic()
+                for update_id, command in enumerate(commands, start=1):
+                    await application.update_queue.put(Update.de_json(command_update(update_id, command), application.bot))
+                while len(request.sent) < 4 + 6 * 2: # 4 ответа "занято" и по два сообщения на каждый /start
+                    await asyncio.sleep(0.01)
+                await application.stop()
+            return started_at
+
+        shed_before = bot_main.admission_controller.shed_count
+        started_at = asyncio.run(asyncio.wait_for(scenario(), timeout=10))
+
+        busy_times = [sent_at for sent_at, text in request.sent if text == BUSY_MESSAGE]
+        self.assertEqual(len(busy_times), 4)
+        self.assertLess(max(busy_times) - started_at, 0.1)
+        self.assertEqual(bot_main.admission_controller.shed_count - shed_before, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+# test_circuit_breaker.py
+import asyncio
+import logging
+import os
+import time
+import unittest
+from unittest import mock
+
+import psycopg2
+
+import db_manager
+from circuit_breaker import CircuitOpenError, STATE_CLOSED
+from db_manager import DBManager
+from game_logic import PetGame
+from storage import AsyncStorage
+
+USER_ROW = (1, 42, "player", "Player", None, 0, None)
+PET_ROW = (1, 1, "toothless", "Зубастик (Ночная Фурия)", 80, 70, 10, None, None, None, None)
+
+
+class FakeDatabase:
+    """Заглушка сервера PostgreSQL: пока up=False, подключения и запросы падают с OperationalError."""
+
+    def __init__(self):
+        self.up = True
+        self.connect_calls = 0
+
+    def connect(self, *args, **kwargs):
+        self.connect_calls += 1
+        if not self.up:
+            raise psycopg2.OperationalError("could not connect to server: Connection refused")
+        return FakeConnection(self)
+
+
+class FakeTransactionInfo:
+    transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.closed = 0
+        self.autocommit = False
+        self.info = FakeTransactionInfo()
+
+    def cursor(self):
+        return FakeCursor(self.database)
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+    def __init__(self, database):
+        self.database = database
+        self.rowcount = 0
+        self._row = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def execute(self, query, params=None):
+        if not self.database.up:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        query = str(query)
+        if "FROM users WHERE" in query:
+            self._row = USER_ROW
+        elif "FROM pets WHERE" in query:
+            self._row = PET_ROW
+        else:
+            self._row = (1,)
+
+    def fetchone(self):
+        return self._row
+
+    def close(self):
+        pass
+
+
+class FakeBot:
+    def __init__(self):
+        self.messages = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.messages.append(text)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        # DBManager - синглтон с состоянием на уровне класса: каждый тест начинает с чистого листа
+        DBManager._instance = None
+        DBManager._pool = None
+        DBManager._circuit_breaker = None
+        DBManager._latency_ewma_ms = None
+        self.database = FakeDatabase()
+        patches = [
+            mock.patch("psycopg2.connect", self.database.connect),
+            mock.patch.dict(os.environ, {"DATABASE_URL": "postgresql://localhost/test"}),
+            mock.patch.object(db_manager, "DB_PROBE_INTERVAL_SECONDS", 0.02),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.manager = DBManager()
+        self.breaker = DBManager._circuit_breaker
+
+    def tearDown(self):
+        # Фоновая проверка должна завершиться до снятия заглушек, иначе она пойдет в настоящий psycopg2
+        self.database.up = True
+        self.wait_until(self.breaker.is_closed)
+        self.manager.close()
+
+    def wait_until(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("Condition was not reached in time.")
+            time.sleep(0.005)
+
+    def trip(self):
+        self.database.up = False
+        for _ in range(db_manager.DB_FAILURE_THRESHOLD):
+            self.manager.get_total_users_count()
+
+    def test_opens_after_threshold_of_outage_errors(self):
+        self.database.up = False
+        for _ in range(db_manager.DB_FAILURE_THRESHOLD - 1):
+            self.manager.get_total_users_count()
+        self.assertTrue(self.manager.is_available())
+        self.manager.get_total_users_count()
+        self.assertFalse(self.manager.is_available())
+
+    def test_fails_fast_while_open(self):
+        self.trip()
+        connect_calls = self.database.connect_calls
+        started_at = time.monotonic()
+        with self.assertRaises(CircuitOpenError):
+            self.manager._get_cursor()
+        self.assertLess(time.monotonic() - started_at, 0.01)
+        self.assertEqual(self.manager.get_total_users_count(), 0)
+        # Запросы не доходят до сервера (фоновая проверка еще не успела подключиться)
+        self.assertLessEqual(self.database.connect_calls - connect_calls, 1)
+
+    def test_status_is_served_from_cache_while_open(self):
+        storage = AsyncStorage(self.manager)
+        self.addCleanup(storage._executor.shutdown)
+        game = PetGame(storage)
+        bot = FakeBot()
+        self.assertEqual(self.manager.get_user(42), USER_ROW)
+        asyncio.run(game.send_pet_status(42, USER_ROW[0], bot))
+
+        self.trip()
+        self.assertEqual(self.manager.get_user(42), USER_ROW)
+        asyncio.run(game.send_pet_status(42, USER_ROW[0], bot))
+        self.assertEqual(len(bot.messages), 2)
+        self.assertEqual(bot.messages[1], bot.messages[0])
+        self.assertIn("Здоровье: 80/100", bot.messages[1])
+
+    def test_closes_after_successful_probe(self):
+        self.trip()
+        self.assertFalse(self.manager.is_available())
+        self.database.up = True
+        self.wait_until(self.manager.is_available)
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.assertEqual(self.manager.get_total_users_count(), 1)
+
+    def test_failed_probe_logs_one_warning_without_traceback(self):
+        self.trip()
+        with self.assertLogs(level=logging.WARNING) as logs:
+            time.sleep(0.1) # Несколько неудачных фоновых проверок
+        self.assertTrue(logs.records)
+        for record in logs.records:
+            self.assertEqual(record.levelno, logging.WARNING)
+            self.assertIsNone(record.exc_info)
+            self.assertIn("Database recovery probe failed", record.getMessage())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# test_economy_sim.py
+import asyncio
+import itertools
+import unittest
+from unittest import mock
+
+import pet_config
+from game_logic import PetGame
+from memory_storage import InMemoryStorage
+from storage import AsyncStorage
+
+try:
+    import numpy as np
+except ImportError: # NumPy нужен только симулятору, боту он не требуется
+    np = None
+
+if np is not None:
+    from economy_sim import EconomySimulator
+
+
+def make_simulator(num_pets, step_seconds, **kwargs):
+    # Длина шага читается при создании симулятора
+    with mock.patch.object(pet_config, "DEGRADATION_INTERVAL_SECONDS", step_seconds):
+        return EconomySimulator(num_pets, seed=3, **kwargs)
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class EconomySimulatorClockTest(unittest.TestCase):
+    def test_half_hour_steps_follow_the_clock(self):
+        simulator = make_simulator(10, 1800)
+        hours = []
+        simulator._act = hours.append
+        simulator._daily = mock.Mock(wraps=simulator._daily)
+        simulator.run(2)
+        self.assertEqual(simulator.step_count, 2 * 48)
+        self.assertEqual(simulator._daily.call_count, 2)
+        self.assertEqual(hours[:4], [0, 0, 1, 1])
+        self.assertEqual(hours[47], 23)
+        self.assertEqual(hours[48], 0)
+
+    def test_engagement_is_scaled_to_step_length(self):
+        hourly = make_simulator(1000, 3600).engagement
+        half_hour = make_simulator(1000, 1800).engagement
+        np.testing.assert_allclose(half_hour, 1 - (1 - hourly) ** 0.5, rtol=1e-4, atol=1e-6)
+
+
+class SilentBot:
+    async def send_message(self, chat_id, text, **kwargs):
+        pass
+
+
+# Стартовые состояния (health, happiness, hunger), включая границы 0 и 100
+STATES = list(itertools.product((1, 50, 97, 100), (0, 50, 96, 100), (0, 5, 20, 95, 100)))
+
+
+@unittest.skipIf(np is None, "NumPy is not installed")
+class EconomySimulatorPetGameParityTest(unittest.TestCase):
+    """Один векторизованный шаг действий должен давать те же параметры, что и PetGame."""
+
+    def run_pet_game(self, feed, play, clean):
+        storage = AsyncStorage(InMemoryStorage())
+        game = PetGame(storage)
+        bot = SilentBot()
+
+        async def scenario():
+            results = []
+            for telegram_id, (health, happiness, hunger) in enumerate(STATES, start=1):
+                user_id = await storage.add_user(telegram_id, None, "Player", None)
+                await storage.create_pet(user_id, "toothless", "Зубастик (Ночная Фурия)")
+                pet = await storage.get_pet(user_id)
+                await storage.update_pet_stats(pet[0], health=health, happiness=happiness, hunger=hunger)
+                # Тот же порядок, что и в EconomySimulator._act
+                if feed:
+                    await game.feed_pet(telegram_id, user_id, bot)
+                if play:
+                    await game.play_with_pet(telegram_id, user_id, bot)
+                if clean:
+                    await game.clean_pet_area(telegram_id, user_id, bot)
+                pet = await storage.get_pet(user_id)
+                results.append((pet[4], pet[5], pet[6]))
+            return results
+
+        return asyncio.run(scenario())
+
+    def run_simulator_step(self, feed, play, clean):
+        simulator = make_simulator(len(STATES), 3600, p_feed=float(feed), p_play=float(play), p_clean=float(clean))
+        health, happiness, hunger = (np.array(values, dtype=np.int16) for values in zip(*STATES))
+        simulator.health, simulator.happiness, simulator.hunger = health, happiness, hunger
+        simulator.engagement[:] = 1 # Заходят все игроки
+        simulator._act(hour_of_day=12)
+        return list(zip(simulator.health.tolist(), simulator.happiness.tolist(), simulator.hunger.tolist()))
+
+    def test_actions_match_pet_game(self):
+        for feed, play, clean in itertools.product((False, True), repeat=3):
+            with self.subTest(feed=feed, play=play, clean=clean):
+                self.assertEqual(self.run_simulator_step(feed, play, clean), self.run_pet_game(feed, play, clean))
+
+    def test_starting_grant_is_not_counted_as_emission(self):
+        simulator = make_simulator(10, 3600, initial_grant=pet_config.INITIAL_TA_COIN)
+        snapshot = simulator.snapshot()
+        self.assertEqual(snapshot["total_emitted"], 0)
+        self.assertEqual(snapshot["initial_grant_total"], 10 * pet_config.INITIAL_TA_COIN)
+
+
+if __name__ == "__main__":
+    unittest.main()
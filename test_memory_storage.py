@@ -0,0 +1,42 @@
+# test_memory_storage.py
+import unittest
+
+from memory_storage import InMemoryStorage
+
+
+class InMemoryStorageTest(unittest.TestCase):
+    """InMemoryStorage должен вести себя как DBManager на тех же вызовах."""
+
+    def setUp(self):
+        self.storage = InMemoryStorage()
+        self.user_id = self.storage.add_user(42, "player", "Player", None)
+
+    def test_duplicate_add_user_returns_existing_id(self):
+        # Как UniqueViolation в DBManager: возвращается ID существующего пользователя, счетчик не растет
+        self.assertEqual(self.storage.add_user(42, "other", "Other", None), self.user_id)
+        self.assertEqual(self.storage.get_game_stats()["total_users"], 1)
+        self.assertEqual(self.storage.get_total_users_count(), 1)
+
+    def test_second_pet_is_rejected(self):
+        self.assertTrue(self.storage.create_pet(self.user_id, "toothless", "Зубастик (Ночная Фурия)"))
+        self.assertFalse(self.storage.create_pet(self.user_id, "stormfly", "Громгильда"))
+        self.assertEqual(self.storage.get_pet(self.user_id)[2], "toothless")
+
+    def test_pet_for_unknown_owner_is_rejected(self):
+        self.assertFalse(self.storage.create_pet(self.user_id + 1, "toothless", "Зубастик (Ночная Фурия)"))
+        self.assertIsNone(self.storage.get_pet(self.user_id + 1))
+
+    def test_only_positive_balance_changes_count_as_emitted(self):
+        self.assertEqual(self.storage.update_user_balance(self.user_id, 50), 50)
+        self.assertEqual(self.storage.update_user_balance(self.user_id, -20), 30)
+        self.assertEqual(self.storage.get_game_stats()["total_emitted_tamacoin"], 50)
+        self.assertEqual(self.storage.get_user(42)[5], 30)
+
+    def test_update_pet_stats_on_missing_pet_succeeds(self):
+        # Как UPDATE в PostgreSQL: ноль затронутых строк - не ошибка
+        self.assertTrue(self.storage.update_pet_stats(999, health=50))
+        self.assertFalse(self.storage.update_pet_stats(999))
+
+
+if __name__ == "__main__":
+    unittest.main()
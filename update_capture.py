@@ -0,0 +1,91 @@
+# update_capture.py
+import asyncio
+import gzip
+import json
+import logging
+import threading
+import time
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+# Как часто сбрасываем буфер на диск: по количеству записей или по времени
+FLUSH_EVERY_RECORDS = 100
+FLUSH_EVERY_SECONDS = 1.0
+
+
+class UpdateCapture:
+    """
+    Потоковая запись входящих апдейтов в сжатый NDJSON-файл (только дозапись).
+
+    Каждая строка: {"ts": <unix time приема>, "update": <update.to_dict()>}.
+    Файл открывается в режиме 'ab', поэтому каждый запуск добавляет новый gzip-член,
+    а gzip.open читает весь файл подряд. Такой файл потом проигрывается через replay_updates.py.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = gzip.open(path, 'ab')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self.records_written = 0
+        logger.info(f"Capturing incoming updates to {path}.")
+
+    def write(self, update_dict, received_at=None):
+        record = {"ts": received_at if received_at is not None else time.time(), "update": update_dict}
+        line = (json.dumps(record, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(line)
+            self.records_written += 1
+            self._pending += 1
+            now = time.monotonic()
+            if self._pending >= FLUSH_EVERY_RECORDS or now - self._last_flush >= FLUSH_EVERY_SECONDS:
+                self._file.flush()
+                self._pending = 0
+                self._last_flush = now
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info(f"Update capture closed, {self.records_written} records written to {self.path}.")
+
+
+class CapturingUpdateQueue(asyncio.Queue):
+    """
+    Очередь апдейтов Application (ApplicationBuilder.update_queue), которая пишет каждый апдейт
+    в UpdateCapture в момент постановки в очередь - то есть сразу при приходе вебхука,
+    до ожидания семафора concurrent_updates. Так всплески трафика при перегрузке
+    сохраняются в захвате как есть.
+    """
+
+    def __init__(self, capture):
+        super().__init__()
+        self.capture = capture
+
+    def put_nowait(self, item):
+        # asyncio.Queue.put() тоже заканчивается вызовом put_nowait(), поэтому каждый апдейт пишется один раз
+        if isinstance(item, Update):
+            self.capture.write(item.to_dict(), received_at=time.time())
+        super().put_nowait(item)
+
+
+def read_capture(path):
+    # Генератор записей из файла захвата; обрезанный хвост (например, после падения процесса) пропускается
+    with gzip.open(path, 'rt', encoding='utf-8') as capture_file:
+        try:
+            for line in capture_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping malformed capture line in {path}.")
+        except (EOFError, gzip.BadGzipFile) as e:
+            logger.warning(f"Capture file {path} is truncated: {e}")
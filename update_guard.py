@@ -0,0 +1,64 @@
+# update_guard.py
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних update_id помним в памяти (скользящее окно)
+DEFAULT_WINDOW_SIZE = 10000
+
+
+class UpdateDeduplicator:
+    """
+    Защита от повторной обработки одного и того же update_id.
+    Telegram повторяет доставку вебхука, если мы отвечаем слишком медленно,
+    поэтому каждый update_id должен обрабатываться ровно один раз.
+
+    Основное хранилище - ограниченное скользящее окно в памяти.
+    Если передан db_manager (AsyncStorage), дополнительно используется таблица processed_updates,
+    чтобы дубликаты отсекались и при запуске нескольких процессов.
+    """
+
+    def __init__(self, window_size=DEFAULT_WINDOW_SIZE, db_manager=None):
+        self.window_size = window_size
+        self.db_manager = db_manager
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._new_since_prune = 0
+        self.duplicates_dropped = 0
+
+    def _remember(self, update_id):
+        # Возвращает True, если update_id встречается впервые (в пределах окна)
+        with self._lock:
+            if update_id in self._seen:
+                self._seen.move_to_end(update_id)
+                return False
+            self._seen[update_id] = True
+            while len(self._seen) > self.window_size:
+                self._seen.popitem(last=False) # Выбрасываем самый старый update_id
+            return True
+
+    async def is_new(self, update_id):
+        if update_id is None:
+            return True # Без update_id нечего сравнивать
+
+        if not self._remember(update_id):
+            self.duplicates_dropped += 1
+            logger.info(f"Duplicate update {update_id} dropped (in-memory window).")
+            return False
+
+        if self.db_manager is not None:
+            is_new_in_db = await self.db_manager.mark_update_processed(update_id)
+            # None - ошибка БД: лучше обработать апдейт повторно, чем потерять его
+            if is_new_in_db is False:
+                self.duplicates_dropped += 1
+                logger.info(f"Duplicate update {update_id} dropped (database store).")
+                return False
+            # Периодически чистим таблицу, чтобы она тоже оставалась ограниченной
+            self._new_since_prune += 1
+            if self._new_since_prune >= self.window_size:
+                self._new_since_prune = 0
+                await self.db_manager.prune_processed_updates()
+
+        return True